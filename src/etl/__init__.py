@@ -2,22 +2,31 @@
 from __future__ import annotations
 
 import asyncio
+import csv
+import functools
 import json # For potential use in load_batch if model_dump_json is not directly used.
+import operator
+from enum import Enum
 from pathlib import Path
-from typing import Optional, List, Dict, Any, Type
-import pandas as pd
-import yaml
-from pydantic import BaseModel
+from typing import TYPE_CHECKING, Optional, List, Dict, Any, Type, Callable
 
-from dotenv import load_dotenv
+from .helpers.windows_loop import install_uvloop
 
-from .extract import load_chats
-from .transform_generic import transform_batch_dynamically # Updated import
-from .load import load_batch # Assumed compatible
-from .schema_factory import load_config_and_create_model # New import for dynamic models
+if TYPE_CHECKING:
+    # pandas, pydantic and the pipeline stages are imported lazily inside main(), so that
+    # `python -m etl --help` and argument errors don't pay for them.
+    import pandas as pd
+    from pydantic import BaseModel
 # StudentProfile is no longer imported directly, replaced by DynamicModel
 
-load_dotenv()
+
+@functools.lru_cache(maxsize=1)
+def _load_env() -> None:
+    """Loads `.env` once per process, before any module reads its settings."""
+    from dotenv import load_dotenv
+    load_dotenv()
+
+OUTPUT_FORMATS = ("csv", "parquet", "feather")
 
 
 def _get_value_from_path(obj: BaseModel, path: str) -> Any:
@@ -36,80 +45,122 @@ def _get_value_from_path(obj: BaseModel, path: str) -> Any:
                 return None # Path does not exist
     return value
 
+def _compile_path(path: str) -> Callable[[Any], Any]:
+    """Precompiles a dot-separated path into a getter, reusable across all rows.
+
+    `operator.attrgetter` resolves dotted paths in C; dict parents or a missing/None
+    parent raise AttributeError, which falls back to `_get_value_from_path`.
+    Enum members (e.g. `Likert`) are unwrapped to their value: `4`, not `Likert.four`.
+    """
+    getter = operator.attrgetter(path)
+
+    def _get(obj: Any) -> Any:
+        try:
+            value = getter(obj)
+        except AttributeError:
+            value = _get_value_from_path(obj, path)
+        return value.value if isinstance(value, Enum) else value
+
+    return _get
+
+def _is_empty(value: Any) -> bool:
+    """True for values that carry no extracted information: None, "" or []."""
+    return value is None or value == "" or value == []
+
+def _resolve_output_format(path: str | Path, output_format: Optional[str] = None) -> str:
+    """Returns the explicit `output_format`, else the one implied by the file suffix (csv by default)."""
+    fmt = (output_format or Path(path).suffix.lstrip(".")).lower()
+    return fmt if fmt in OUTPUT_FORMATS else "csv"
+
+def _write_df(df: pd.DataFrame, path: str | Path, fmt: str) -> None:
+    """Writes `df` as Parquet or Feather (CSV is streamed by `_batch_to_csv_dynamically`)."""
+    if fmt == "parquet":
+        df.to_parquet(path, engine="pyarrow", compression="snappy", index=False)
+    else:
+        df.reset_index(drop=True).to_feather(path)
+
 def _batch_to_csv_dynamically(
     batch: List[BaseModel],
     csv_mapping: Dict[str, str],
-    output_csv_path: str | Path
+    output_csv_path: str | Path,
+    output_format: Optional[str] = None
 ) -> None:
-    """Convert a batch of dynamic Pydantic model instances to a CSV file based on csv_mapping."""
-    if not batch:
-        # Create an empty CSV with headers if the batch is empty
-        df = pd.DataFrame(columns=list(csv_mapping.keys()))
-        df.to_csv(output_csv_path, index=False)
+    """Convert a batch of dynamic Pydantic model instances to a CSV (or Parquet/Feather) file based on csv_mapping.
+
+    CSV rows are streamed straight to disk. Rows where every non-identifier column is
+    empty are dropped; an empty batch still yields a file with headers.
+    """
+    headers = list(csv_mapping.keys())
+    # Paths never change across rows, so resolve them into getters once (in header order)
+    getters = [_compile_path(path) for path in csv_mapping.values()]
+
+    # Positions of the columns that carry extracted information, beyond the identifiers
+    meaningful_idx = tuple(
+        i for i, k in enumerate(headers) if k.lower() not in ("chat_id", "user_email", "extracted_at")
+    )
+
+    def _rows():
+        for p_instance in batch:
+            # Plain lists in header order: no per-row dict, no column reindex afterwards
+            row = [getter(p_instance) for getter in getters]
+            # Skip rows with no extracted information beyond identifiers
+            # (a mapping with identifier columns only keeps every row)
+            if meaningful_idx and not any(not _is_empty(row[i]) for i in meaningful_idx):
+                continue
+            yield row
+
+    fmt = _resolve_output_format(output_csv_path, output_format)
+    if fmt == "csv":
+        # 1 MiB buffer: no per-row flushes, constant memory regardless of batch size
+        with open(output_csv_path, "w", newline="", encoding="utf-8", buffering=1 << 20) as f:
+            writer = csv.writer(f)
+            writer.writerow(headers)
+            writer.writerows(_rows())
         return
 
-    rows = []
-    for p_instance in batch:
-        row = {}
-        for csv_header, model_path in csv_mapping.items():
-            row[csv_header] = _get_value_from_path(p_instance, model_path)
-        
-        # Determine if there is meaningful data beyond chat_id and user_email (if they exist)
-        # This logic might need to be made more flexible or configurable
-        meaningful_keys = [
-            k for k in row.keys() if k.lower() not in ("chat_id", "user_email", "extracted_at")
-        ]
-        if not meaningful_keys or all(row[k] in (None, "", []) for k in meaningful_keys):
-             # Skip rows with no extracted information beyond identifiers, unless config says otherwise
-             # For now, we keep this logic similar to original for student profiles.
-             # A more robust solution might involve a config flag: `skip_empty_extractions: true`
-            pass # Potentially skip, or ensure identifiers are still written if that's desired.
-            # If we must write something, ensure chat_id and user_email are present if mapped.
-            # if "chat_id" not in row and "chat_id" in csv_mapping.values(): # crude check
-            # continue # skip empty
-        rows.append(row)
-    
-    if not rows and batch: # All rows were considered empty by the logic above
-        # Fallback: create rows with at least the mapped identifiers if available
-        # Or write an empty CSV with headers if no identifiers are reliably present or mapped.
-        # This ensures we don't write a completely empty file if all data rows are filtered out
-        # but there was data in the batch.
-        # For now, if all are filtered, an empty df with headers will be written.
-        pass 
-
-    df = pd.DataFrame(rows)
-    # Ensure all columns from csv_mapping are present, even if all values were None
-    for header in csv_mapping.keys():
-        if header not in df.columns:
-            df[header] = None
-    df = df[list(csv_mapping.keys())] # Order columns as per mapping
-    df.to_csv(output_csv_path, index=False)
+    # Columnar formats need the whole frame, built in one shot with the final column order
+    import pandas as pd
+    df = pd.DataFrame(list(_rows()), columns=headers)
+    _write_df(df, output_csv_path, fmt)
 
 
 async def main(
     csv_path: str | Path,
     config_path: str | Path = "src/etl/configs/student.yml", # Default to student config
-    output_csv_path: Optional[str | Path] = None
+    output_csv_path: Optional[str | Path] = None,
+    output_format: Optional[str] = None
 ) -> None:
-    """Run the full ETL for a single CSV file using a dynamic configuration."""
+    """Run the full ETL for a single CSV file using a dynamic configuration.
+
+    `output_format` ("csv", "parquet" or "feather") overrides the format inferred from
+    the suffix of `output_csv_path`; it is ignored when loading to the database.
+    """
+    _load_env() # Before the imports below, so constants.py sees values from .env
+    from .extract import load_chats
+    from .transform_generic import transform_batch_dynamically
+    from .load import load_batch
+    from .openai_utils import close_client
+    from .schema_factory import load_config, create_model_from_config
     
-    # Load YAML configuration
-    with open(config_path, 'r') as f:
-        config = yaml.safe_load(f)
+    # Load YAML configuration once (served from the JSON sidecar cache when fresh)
+    config = load_config(config_path)
     
-    # Create dynamic Pydantic model from schema in config
-    DynamicModel: Type[BaseModel] = load_config_and_create_model(str(config_path)) # schema_factory handles this
+    # Create dynamic Pydantic model from schema in the already parsed config
+    DynamicModel: Type[BaseModel] = create_model_from_config(config)
 
     df_input = load_chats(csv_path) # Extract remains the same
     
     # Transform using the dynamic model and config
-    batch_of_models = await transform_batch_dynamically(df_input, config, DynamicModel)
+    try:
+        batch_of_models = await transform_batch_dynamically(df_input, config, DynamicModel)
+    finally:
+        await close_client() # Its connections are tied to this loop; don't leave them to the next run
     
     if output_csv_path:
         csv_mapping = config.get("csv_mapping", {})
         if not csv_mapping:
             print("Warning: No csv_mapping found in config. CSV output will be empty or incomplete.")
-        _batch_to_csv_dynamically(batch_of_models, csv_mapping, output_csv_path)
+        _batch_to_csv_dynamically(batch_of_models, csv_mapping, output_csv_path, output_format)
     else:
         # Load to database (assumed compatible with list of Pydantic models)
         # The load_batch function expects StudentProfile, but since it converts to JSON,
@@ -125,8 +176,10 @@ async def main(
 def run( # Sync wrapper
     csv_path: str | Path,
     config_path: str | Path = "src/etl/configs/student.yml",
-    output_csv_path: Optional[str | Path] = None
+    output_csv_path: Optional[str | Path] = None,
+    output_format: Optional[str] = None
 ): 
     """Sync wrapper for Windows & *nix CLI."""
     # patch_windows_event_loop() # This should be called in __main__.py if still needed
-    asyncio.run(main(csv_path, config_path, output_csv_path)) 
\ No newline at end of file
+    install_uvloop()
+    asyncio.run(main(csv_path, config_path, output_csv_path, output_format)) 
\ No newline at end of file
@@ -6,8 +6,8 @@ import sys
 from pathlib import Path
 import argparse
 
-from etl import main as etl_main
-from etl.helpers.windows_loop import patch_windows_event_loop
+from etl import main as etl_main, OUTPUT_FORMATS
+from etl.helpers.windows_loop import patch_windows_event_loop, install_uvloop
 
 def main():
     parser = argparse.ArgumentParser(description="Run Adhlal ETL pipeline.")
@@ -26,10 +26,20 @@ def main():
         help="Output CSV file for structured results (e.g., output/structured_data.csv)", 
         default=None
     )
+    parser.add_argument(
+        "--output-format",
+        choices=OUTPUT_FORMATS,
+        default=None,
+        help=(
+            "File format for --output-csv. Defaults to the output file's suffix "
+            "(.parquet / .feather), otherwise csv."
+        )
+    )
     args = parser.parse_args()
 
     patch_windows_event_loop()
-    asyncio.run(etl_main(Path(args.input_csv), Path(args.config), args.output_csv))
+    install_uvloop()
+    asyncio.run(etl_main(Path(args.input_csv), Path(args.config), args.output_csv, args.output_format))
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
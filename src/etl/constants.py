@@ -7,4 +7,11 @@ OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 MAX_RETRIES  = 3
 TEMPERATURE  = 0.0
 MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "5"))
-MAX_CORPUS_CHARS = int(os.getenv("MAX_CORPUS_CHARS", "15000")) 
\ No newline at end of file
+LLM_BATCH_SIZE = max(1, int(os.getenv("LLM_BATCH_SIZE", "1")))  # chats per LLM request
+MAX_CORPUS_CHARS = int(os.getenv("MAX_CORPUS_CHARS", "15000"))
+MAX_CORPUS_TOKENS = int(os.getenv("MAX_CORPUS_TOKENS", "4000"))  # used instead of chars when tiktoken is installed
+# Skip pydantic validation of coerced LLM output (model_construct); only for trusted prompts/models
+TRUSTED_LLM_OUTPUT = os.getenv("TRUSTED_LLM_OUTPUT", "false").lower() in ("1", "true", "yes")
+# Let the OpenAI SDK constrain and parse the output against the dynamic model (structured outputs)
+# instead of json_object mode + _coerce_llm_output; applies to single-chat requests
+STRUCTURED_LLM_OUTPUT = os.getenv("STRUCTURED_LLM_OUTPUT", "false").lower() in ("1", "true", "yes")
@@ -2,6 +2,7 @@
 from __future__ import annotations
 
 from pathlib import Path
+import numpy as np
 import pandas as pd
 
 EXPECTED_COLS = {
@@ -12,14 +13,45 @@ EXPECTED_COLS = {
     "message_timestamp",
 }
 
+# dtypes for the Arrow reader; text columns stay Arrow-backed instead of Python objects
+_ARROW_DTYPES = {
+    "chat_id": "int64",
+    "user_email": "string[pyarrow]",
+    "message_author": "string[pyarrow]",
+    "message_content": "string[pyarrow]",
+}
+
+
+def _read_csv(csv_path: str | Path) -> pd.DataFrame:
+    """Read only the expected columns, via Arrow's multi-threaded parser when available."""
+    usecols = sorted(EXPECTED_COLS)
+    try:
+        return pd.read_csv(
+            csv_path,
+            engine="pyarrow",
+            usecols=usecols,
+            dtype=_ARROW_DTYPES,
+            parse_dates=["message_timestamp"],
+        )
+    except ImportError:
+        # pyarrow not installed → default C engine, same columns
+        return pd.read_csv(csv_path, usecols=usecols)
+
 
 def load_chats(csv_path: str | Path) -> pd.DataFrame:  # noqa: ANN001 – pandas dance
-    df = pd.read_csv(csv_path)
+    """Load an export as one row per message, sorted by chat then time.
 
-    missing = EXPECTED_COLS - set(df.columns)
+    `chat_id` comes back as a categorical, so group with
+    `df.groupby("chat_id", sort=False, observed=True)`.
+    """
+    # header-only read so a malformed export still gets the friendly error below
+    header = pd.read_csv(csv_path, nrows=0).columns
+    missing = EXPECTED_COLS - set(header)
     if missing:
         raise ValueError(f"CSV missing columns: {', '.join(missing)}")
 
+    df = _read_csv(csv_path)
+
     # ── standardise shape
     df = df.rename(
         columns={
@@ -30,8 +62,11 @@ def load_chats(csv_path: str | Path) -> pd.DataFrame:  # noqa: ANN001 – pandas
 
     df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
 
-    df["speaker"] = df["message_author"].str.upper().map(
-        lambda role: "participant" if role == "HUMAN" else "agent"
+    # vectorised role → speaker; categorical keeps the column to one byte per row
+    is_human = (df["message_author"].str.upper() == "HUMAN").to_numpy(dtype=bool, na_value=False)
+    df["speaker"] = pd.Categorical(
+        np.where(is_human, "participant", "agent"),
+        categories=["participant", "agent"],
     )
 
     df = (
@@ -42,8 +77,9 @@ def load_chats(csv_path: str | Path) -> pd.DataFrame:  # noqa: ANN001 – pandas
             "message",
             "timestamp",
         ]]
-        .sort_values(["chat_id", "timestamp"])
+        .sort_values(["chat_id", "timestamp"])  # sort on the numeric ids, then cast
         .reset_index(drop=True)
     )
+    df["chat_id"] = pd.Categorical(df["chat_id"])
 
     return df 
\ No newline at end of file
@@ -1,17 +1,32 @@
 """Turn one chat's participant messages into a dynamic Pydantic model instance based on config."""
 from __future__ import annotations
 
-import json
+try:  # orjson parses LLM output several times faster; stdlib json is the fallback
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    orjson = None
+    from json import loads as _json_loads
+import functools
+import re
+import string
 import textwrap # Not strictly needed if prompt_template is already dedented in YAML
-from typing import Dict, Any, Type, Union, Optional
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Tuple, Type, Optional
 
 import pandas as pd
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter, ValidationError
+try:
+    import tiktoken
+except ImportError:  # corpus is then truncated by characters
+    tiktoken = None
 
-from .openai_utils import call_llm
-from .constants import MAX_CORPUS_CHARS # Assuming this is still relevant
-from .schema_factory import create_dynamic_model, generate_schema_example
-from .models import Likert # Added import for Likert
+from .openai_utils import LLMSchemaError, call_llm
+from .constants import (
+    MAX_CORPUS_CHARS, MAX_CORPUS_TOKENS, OPENAI_MODEL, STRUCTURED_LLM_OUTPUT, TRUSTED_LLM_OUTPUT
+)
+from .models import Likert
+from .schema_factory import create_dynamic_model, generate_schema_example, classify_fields
 
 # Mapping for Likert scale string values to integers
 LIKERT_STRING_TO_INT_MAP: Dict[str, int] = {
@@ -47,128 +62,203 @@ LIKERT_STRING_TO_INT_MAP: Dict[str, int] = {
     "5": 5,
 }
 
-def _coerce_llm_output(raw_json: str, DynamicModel: Type[BaseModel]) -> dict:
+# Same map keyed by both the raw and the stripped/lower-cased spelling, so the common
+# case is a single dict lookup and normalisation only runs on a miss.
+_LIKERT_LOOKUP: Dict[str, int] = {
+    **{k.strip().lower(): v for k, v in LIKERT_STRING_TO_INT_MAP.items()},
+    **LIKERT_STRING_TO_INT_MAP,
+}
+
+# Eastern Arabic → Western digits, and everything-but-digits, for graduation_year cleanup
+_EASTERN_TO_WESTERN = str.maketrans("٠١٢٣٤٥٦٧٨٩", "0123456789")
+_NON_DIGIT_RE = re.compile(r"[^0-9]")
+
+def _likert_from_number(value: Any) -> Optional[int]:
+    """Rounds a numeric Likert answer (number or numeric string) to 1-5; None if it isn't one."""
+    try:
+        num_val = int(round(float(value)))
+    except (ValueError, TypeError, OverflowError): # Not a simple number (or nan/inf)
+        return None
+    # Out-of-range numbers are left for _normalize / Pydantic to deal with
+    return num_val if 1 <= num_val <= 5 else None
+
+def _likert_value(value: Any) -> Optional[int]:
+    """Maps a Likert answer (label, numeric string or number) to 1-5; None if it isn't one."""
+    if isinstance(value, str):
+        mapped_value = _LIKERT_LOOKUP.get(value)
+        if mapped_value is None:
+            mapped_value = _LIKERT_LOOKUP.get(value.strip().lower())
+        if mapped_value is None:
+            mapped_value = _likert_from_number(value)
+        return mapped_value
+    if isinstance(value, (int, float)):
+        return _likert_from_number(value)
+    return None
+
+def _to_year(value: Any) -> Optional[int]:
+    """Cleans a graduation year (Eastern Arabic digits, stray text) into an int, else None."""
+    if value is None:
+        return None
+    try:
+        # Convert Eastern Arabic numerals to Western, then drop everything but digits
+        cleaned_year_str = _NON_DIGIT_RE.sub("", str(value).translate(_EASTERN_TO_WESTERN))
+        return int(round(float(cleaned_year_str))) if cleaned_year_str else None
+    except (ValueError, TypeError):
+        return None # If any conversion error, set to None
+
+def _first_item(value: Any) -> Any:
+    """Unwraps a list answer (e.g. several phone numbers) to its first item as a string."""
+    if isinstance(value, list):
+        return str(value[0]) if value else None
+    return value
+
+# Per-key rules applied inside a nested block, keyed by the block's field kind
+# (see schema_factory.classify_fields). Built once at import time.
+_NESTED_RULES: Dict[str, Dict[str, Any]] = {
+    "edu": {"graduation_year": _to_year},
+    "contact": {"phone": _first_item},
+}
+
+def _nested_model(annotation: Any) -> Optional[Type[BaseModel]]:
+    """Returns the model class behind a `Model` or `Optional[Model]` annotation, else None."""
+    for candidate in (annotation, *getattr(annotation, '__args__', ())):
+        if isinstance(candidate, type) and issubclass(candidate, BaseModel):
+            return candidate
+    return None
+
+@functools.lru_cache(maxsize=None)
+def _likert_fields(model: Type[BaseModel]) -> frozenset:
+    """Names of the Likert fields of `model`, root or nested, computed once per model class."""
+    likert_fields = getattr(model, "__likert_fields__", None)
+    if likert_fields is None: # Nested models only get their kinds classified here
+        likert_fields = frozenset(name for name, kind in classify_fields(model).items() if kind == "likert")
+    return likert_fields
+
+def _normalize(value: Any, field_info: Any = None, rules: Optional[Dict[str, Any]] = None) -> Any:
+    """Blank strings → None, recursing into nested models and applying per-key `rules` on the way.
+
+    Nested Likert fields get the same label/number mapping as top-level ones.
+    One walk over the payload: each nested dict is copied exactly once.
+    """
+    if isinstance(value, str):
+        return None if not value.strip() else value
+    if not isinstance(value, dict):
+        return value
+    nested = _nested_model(field_info.annotation) if field_info is not None else None
+    if nested is None and not rules:
+        return value
+    nested_fields = nested.model_fields if nested is not None else None
+    likert_fields = _likert_fields(nested) if nested is not None else frozenset()
+    normalized = {}
+    for key, item in value.items():
+        rule = rules.get(key) if rules else None
+        if rule is not None:
+            item = rule(item)
+        if key in likert_fields:
+            mapped_value = _likert_value(item)
+            if mapped_value is not None:
+                normalized[key] = mapped_value
+                continue
+        normalized[key] = _normalize(item, nested_fields.get(key)) if nested_fields is not None else item
+    return normalized
+
+def _coerce_llm_output(raw_json: str | Dict[str, Any], DynamicModel: Type[BaseModel]) -> dict:
     """Post-process LLM output to coerce/rename fields to match the dynamic schema.
        This version includes specific handling for Likert scale string-to-int conversion.
+       Accepts the raw JSON string, or one already parsed object (batched responses).
     """
-    data = json.loads(raw_json)
+    data = _json_loads(raw_json) if isinstance(raw_json, (str, bytes)) else dict(raw_json)
     coerced_data = {}
+    # Bind the field map once instead of going through the model attribute per key
+    fields = DynamicModel.model_fields
 
     # Example coercions (can be expanded or made config-driven if needed):
-    if 'email' in data and 'user_email' not in data and hasattr(DynamicModel, 'user_email'):
+    if 'email' in data and 'user_email' not in data and 'user_email' in fields:
         data['user_email'] = data.pop('email')
-    
-    # Convert empty strings to None for cleaner CSV output (apply generally)
-    # This function is now applied after specific coercions like Likert.
-    def _blank_to_none(x, field_info=None):
-        if isinstance(x, str) and not x.strip():
-            return None
-        if isinstance(x, dict) and field_info and hasattr(field_info.annotation, 'model_fields'):
-            nested_model_fields = field_info.annotation.model_fields
-            return {k_n: _blank_to_none(v_n, nested_model_fields.get(k_n)) for k_n, v_n in x.items()}
-        return x
 
+    # Per-field kinds are precomputed on the model by schema_factory.create_model_from_config
+    field_kind = getattr(DynamicModel, "__field_kind__", None) or classify_fields(DynamicModel)
+
+    # Single pass: Likert mapping, nested per-key rules and blank → None together
     for key, value in data.items():
-        if key in DynamicModel.model_fields:
-            field_info = DynamicModel.model_fields[key]
-            current_value = value # Original value from LLM for this key
-
-            # Check if the field is a Likert scale type
-            actual_type = field_info.annotation
-            is_optional_likert = False
-            is_direct_likert = actual_type == Likert
-
-            if getattr(actual_type, '__origin__', None) is Union: # Handles Optional[Likert]
-                type_args = getattr(actual_type, '__args__', ())
-                if Likert in type_args and type(None) in type_args:
-                    is_optional_likert = True
-            
-            is_likert_field = is_direct_likert or is_optional_likert
-
-            if is_likert_field:
-                processed_likert = False
-                if isinstance(current_value, str):
-                    normalized_value = current_value.strip().lower()
-                    mapped_value = LIKERT_STRING_TO_INT_MAP.get(normalized_value)
-                    if mapped_value is not None:
-                        coerced_data[key] = mapped_value
-                        processed_likert = True
-                    else:
-                        try:
-                            num_val_float = float(current_value)
-                            num_val_int = int(round(num_val_float))
-                            if 1 <= num_val_int <= 5:
-                                coerced_data[key] = num_val_int
-                                processed_likert = True
-                            # else: Let Pydantic validate if out of Likert enum range (if not caught by map/direct conversion)
-                        except ValueError:
-                            pass # Not a simple number string, will be handled by _blank_to_none or Pydantic
-                elif isinstance(current_value, (int, float)):
-                    try:
-                        num_val = int(round(float(current_value)))
-                        if 1 <= num_val <= 5:
-                           coerced_data[key] = num_val
-                           processed_likert = True
-                        # else: let Pydantic handle out-of-range numbers
-                    except (ValueError, TypeError):
-                        pass # Will be handled by _blank_to_none or Pydantic
-                
-                if not processed_likert: # If not processed as Likert, store original (or blank_to_none version)
-                    coerced_data[key] = _blank_to_none(current_value, field_info)
-            
-            elif key == "education" and isinstance(current_value, dict) and "graduation_year" in current_value:
-                # Handle graduation_year specifically within the education block if education itself is being processed
-                edu_data_copy = current_value.copy() # Operate on a copy
-                grad_year = edu_data_copy.get("graduation_year")
-                if grad_year is not None:
-                    try:
-                        year_str = str(grad_year)
-                        # Convert Eastern Arabic numerals to Western
-                        eastern_to_western_map = str.maketrans("٠١٢٣٤٥٦٧٨٩", "0123456789")
-                        western_year_str = year_str.translate(eastern_to_western_map)
-                        
-                        import re
-                        cleaned_year_str = re.sub(r"[^0-9]", "", western_year_str)
-                        if cleaned_year_str:
-                            edu_data_copy["graduation_year"] = int(round(float(cleaned_year_str)))
-                        else: # If stripping results in empty, set to None or original? For now, None.
-                            edu_data_copy["graduation_year"] = None 
-                    except (ValueError, TypeError):
-                        edu_data_copy["graduation_year"] = None # If any conversion error, set to None
-                coerced_data[key] = _blank_to_none(edu_data_copy, field_info)
-
-            elif key == "contact_info" and isinstance(current_value, dict) and "phone" in current_value:
-                contact_data_copy = current_value.copy()
-                phone_val = contact_data_copy.get("phone")
-                if isinstance(phone_val, list):
-                    if phone_val:
-                        contact_data_copy["phone"] = str(phone_val[0])
-                    else:
-                        contact_data_copy["phone"] = None
-                coerced_data[key] = _blank_to_none(contact_data_copy, field_info)
-
-            else: # For all other fields not specifically handled
-                coerced_data[key] = _blank_to_none(current_value, field_info)
-        else:
-            # Handle fields from LLM not in the model schema (e.g. log, ignore, or error)
-            # For now, we'll ignore them to be robust to extra fields from LLM.
-            pass 
+        kind = field_kind.get(key)
+        if kind is None:
+            # Fields from the LLM that are not in the schema are ignored, to be robust to extras
+            continue
+        if kind == "likert":
+            mapped_value = _likert_value(value)
+            if mapped_value is not None:
+                coerced_data[key] = mapped_value
+                continue
+        coerced_data[key] = _normalize(value, fields[key], _NESTED_RULES.get(kind))
     return coerced_data
 
 
-async def analyse_chat_dynamically(
-    chat_df: pd.DataFrame,
-    config: Dict[str, Any],
-    DynamicModel: Type[BaseModel]
-) -> BaseModel:
-    """Processes a single chat DataFrame according to the provided dynamic model and config."""
-    
-    corpus = "\n".join(
-        chat_df.loc[chat_df["speaker"] == "participant", "message"].tolist()
+@functools.lru_cache(maxsize=1)
+def _token_encoder() -> Optional["tiktoken.Encoding"]:
+    """The tiktoken encoding for OPENAI_MODEL, loaded once; None when tiktoken is not installed."""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(OPENAI_MODEL)
+    except KeyError: # Model unknown to this tiktoken version
+        return tiktoken.get_encoding("o200k_base")
+
+
+def _truncate_corpus(corpus: str) -> str:
+    """Keeps the tail of the corpus within MAX_CORPUS_TOKENS (or MAX_CORPUS_CHARS without tiktoken)."""
+    encoder = _token_encoder()
+    if encoder is None:
+        return corpus[-MAX_CORPUS_CHARS:] if len(corpus) > MAX_CORPUS_CHARS else corpus
+    # Tokens are byte-level, so a character is at most 4 tokens: short corpora skip encoding
+    if 4 * len(corpus) <= MAX_CORPUS_TOKENS:
+        return corpus
+    token_ids = encoder.encode(corpus, disallowed_special=())
+    if len(token_ids) > MAX_CORPUS_TOKENS:
+        corpus = encoder.decode(token_ids[-MAX_CORPUS_TOKENS:])
+    return corpus
+
+
+@functools.lru_cache(maxsize=8)
+def _compile_prompt_template(template: str) -> Optional[Tuple[Tuple[str, Optional[str]], ...]]:
+    """Splits a prompt template once into (literal, placeholder) parts.
+
+    Returns None for templates using anything beyond plain `{name}` placeholders
+    (conversions, format specs, attribute/index access), which keep using str.format.
+    """
+    parts = []
+    for literal, field_name, format_spec, conversion in string.Formatter().parse(template):
+        if field_name is not None and (format_spec or conversion or not field_name.isidentifier()):
+            return None
+        parts.append((literal, field_name))
+    return tuple(parts)
+
+
+def _render_prompt(template: str, format_args: Dict[str, Any]) -> str:
+    """`template.format(**format_args)` without re-parsing the (~1 KB) template for every chat."""
+    parts = _compile_prompt_template(template)
+    if parts is None:
+        return template.format(**format_args)
+    return "".join(
+        literal if field_name is None else literal + str(format_args[field_name])
+        for literal, field_name in parts
     )
-    # Truncate corpus if too long
-    if len(corpus) > MAX_CORPUS_CHARS:
-        corpus = corpus[-MAX_CORPUS_CHARS:]
+
+
+async def _raw_to_dict(
+    first_row: Dict[str, Any],
+    corpus: str,
+    config: Dict[str, Any],
+    DynamicModel: Type[BaseModel],
+    extracted_at: str
+) -> Dict[str, Any]:
+    """Runs the LLM over a single chat and returns coerced data, not yet validated by DynamicModel.
+
+    `first_row` holds the chat-level columns (chat_id, user_email, ...), `corpus` the joined
+    participant messages, and `extracted_at` the batch-wide ISO timestamp stamped on every record.
+    """
+    # Truncate corpus if too long (by tokens, i.e. exactly what the LLM is billed for)
+    corpus = _truncate_corpus(corpus)
 
     # Generate the schema example string from the dynamic model
     schema_example_str = generate_schema_example(DynamicModel)
@@ -179,86 +269,232 @@ async def analyse_chat_dynamically(
     # Format the prompt
     # Ensure all required placeholders in the template are available
     prompt_format_args = {
-        "chat_id": int(chat_df.iloc[0]["chat_id"]),
-        "user_email": chat_df.iloc[0]["user_email"],
+        "chat_id": int(first_row["chat_id"]),
+        "user_email": first_row["user_email"],
         "corpus": corpus,
         "_SCHEMA_EXAMPLE": schema_example_str,
     }
-    # Add any other placeholders defined in the schema to prompt_format_args if they exist in chat_df.iloc[0]
+    # Add any other placeholders defined in the schema to prompt_format_args if they exist in the first row
     # This makes it flexible if prompts want to use e.g. assistant_id if it's in the schema & data
-    for key in DynamicModel.model_fields.keys():
-        if key not in prompt_format_args and key in chat_df.iloc[0].index:
-            prompt_format_args[key] = chat_df.iloc[0][key]
+    for key in DynamicModel.model_fields.keys() & first_row.keys():
+        if key not in prompt_format_args:
+            prompt_format_args[key] = first_row[key]
     
-    final_prompt = prompt_template.format(**prompt_format_args)
+    final_prompt = _render_prompt(prompt_template, prompt_format_args)
     
+    if STRUCTURED_LLM_OUTPUT:
+        # Output constrained to DynamicModel server-side and parsed by the SDK: no coercion
+        # pass needed (validation of the finalised data still happens with the batch)
+        try:
+            parsed = await call_llm(final_prompt, DynamicModel)
+        except LLMSchemaError as e:
+            # e.g. an email the Email check rejects: redo this chat in JSON mode below, so it
+            # degrades through coercion/_validate_chat like any other instead of failing the batch
+            print(f"Structured output rejected for chat_id {prompt_format_args['chat_id']}, retrying in JSON mode: {e}")
+        else:
+            coerced_data = parsed.model_dump(mode="json", exclude_unset=True)
+            return _finalise_chat_data(coerced_data, first_row, DynamicModel, extracted_at)
+
     # Call LLM
-    raw_response_json_str = call_llm(final_prompt, str) # Expect raw JSON string
+    raw_response_json_str = await call_llm(final_prompt, str) # Expect raw JSON string
 
-    # Coerce and validate
+    # Coerce (validation happens later, for the whole batch at once)
     coerced_data = _coerce_llm_output(raw_response_json_str, DynamicModel)
+    return _finalise_chat_data(coerced_data, first_row, DynamicModel, extracted_at)
+
 
-    # Validate with the dynamic model
-    # Pydantic will raise a ValidationError if the coerced_data doesn't match the DynamicModel fields/types
+def _finalise_chat_data(
+    coerced_data: Dict[str, Any],
+    first_row: Dict[str, Any],
+    DynamicModel: Type[BaseModel],
+    extracted_at: str
+) -> Dict[str, Any]:
+    """Fills chat_id, user_email and extracted_at from the chat itself where the LLM left them out."""
+    final_data_for_model = coerced_data.copy()
+    if "chat_id" not in final_data_for_model and "chat_id" in first_row:
+        final_data_for_model["chat_id"] = int(first_row["chat_id"])
+    
+    # Fallback for user_email if not provided by LLM but present in CSV
+    if "user_email" not in final_data_for_model or final_data_for_model.get("user_email") is None:
+        if "user_email" in first_row and pd.notna(first_row["user_email"]):
+            final_data_for_model["user_email"] = first_row["user_email"]
+        else:
+            # If still None and it's a required field in the model, provide a placeholder
+            if "user_email" in DynamicModel.model_fields and not DynamicModel.model_fields["user_email"].is_required() is False: # Check if it's required
+                 if final_data_for_model.get("user_email") is None: # If truly None after all attempts
+                    final_data_for_model["user_email"] = "unknown@example.com" # Placeholder
+
+    # Ensure 'extracted_at' is always set to a valid datetime if the field exists in the model.
+    # This overrides any null from LLM or if it's missing.
+    if 'extracted_at' in DynamicModel.model_fields:
+        final_data_for_model['extracted_at'] = extracted_at
+
+    return final_data_for_model
+
+
+# Appended to the schema example when several chats share one request
+_BATCH_SCHEMA_NOTE = (
+    "\n\nThis request covers {n} separate chats, each introduced by its own CHAT header in the "
+    "messages above. Treat them independently and return a JSON object of the form "
+    '{{"results": [...]}} with exactly one object per chat, in the same order, each matching '
+    "the schema above and including that chat's chat_id."
+)
+
+
+async def _raw_to_dicts_batched(
+    chats: List[Tuple[Dict[str, Any], str]],
+    config: Dict[str, Any],
+    DynamicModel: Type[BaseModel],
+    extracted_at: str
+) -> List[Dict[str, Any]]:
+    """Like `_raw_to_dict`, but for several `(first_row, corpus)` chats sharing one LLM request.
+
+    The fixed prompt scaffolding is sent once for the whole window. Chats the response does
+    not cover (missing or unparseable entries) are retried on their own.
+    """
+    if len(chats) == 1:
+        first_row, corpus = chats[0]
+        return [await _raw_to_dict(first_row, corpus, config, DynamicModel, extracted_at)]
+
+    sections = [
+        f"===== CHAT {int(first_row['chat_id'])} (user email: {first_row['user_email']}) =====\n"
+        f"{_truncate_corpus(corpus)}"
+        for first_row, corpus in chats
+    ]
+    per_chat = "(given per chat below)"
+    prompt_format_args = {
+        "chat_id": per_chat,
+        "user_email": per_chat,
+        "corpus": "\n\n".join(sections),
+        "_SCHEMA_EXAMPLE": generate_schema_example(DynamicModel) + _BATCH_SCHEMA_NOTE.format(n=len(chats)),
+    }
+    for key in DynamicModel.model_fields.keys() & chats[0][0].keys():
+        prompt_format_args.setdefault(key, per_chat)
+
+    raw_response_json_str = await call_llm(_render_prompt(config["prompt_template"], prompt_format_args), str)
     try:
-        final_data_for_model = coerced_data.copy()
-        if "chat_id" not in final_data_for_model and "chat_id" in chat_df.iloc[0].index:
-             final_data_for_model["chat_id"] = int(chat_df.iloc[0]["chat_id"])
-        
-        # Fallback for user_email if not provided by LLM but present in CSV
-        if "user_email" not in final_data_for_model or final_data_for_model.get("user_email") is None:
-            if "user_email" in chat_df.iloc[0].index and pd.notna(chat_df.iloc[0]["user_email"]):
-                final_data_for_model["user_email"] = chat_df.iloc[0]["user_email"]
-            else:
-                # If still None and it's a required field in the model, provide a placeholder
-                if "user_email" in DynamicModel.model_fields and not DynamicModel.model_fields["user_email"].is_required() is False: # Check if it's required
-                     if final_data_for_model.get("user_email") is None: # If truly None after all attempts
-                        final_data_for_model["user_email"] = "unknown@example.com" # Placeholder
-
-        # Ensure 'extracted_at' is always set to a valid datetime if the field exists in the model.
-        # This overrides any null from LLM or if it's missing.
-        if 'extracted_at' in DynamicModel.model_fields:
-            from datetime import datetime
-            final_data_for_model['extracted_at'] = datetime.utcnow().isoformat()
-
-        instance = DynamicModel.model_validate(final_data_for_model)
+        results = _json_loads(raw_response_json_str).get("results")
+    except (ValueError, AttributeError):
+        results = None
+    by_chat_id: Dict[int, Dict[str, Any]] = {}
+    for item in results if isinstance(results, list) else ():
+        try:
+            by_chat_id[int(item["chat_id"])] = item
+        except (TypeError, KeyError, ValueError):
+            pass # Entry without a usable chat_id: its chat is retried on its own below
+
+    batch_data = []
+    for first_row, corpus in chats:
+        item = by_chat_id.get(int(first_row["chat_id"]))
+        if item is None:
+            batch_data.append(await _raw_to_dict(first_row, corpus, config, DynamicModel, extracted_at))
+        else:
+            coerced_data = _coerce_llm_output(item, DynamicModel)
+            coerced_data.pop("chat_id", None) # Matched on it (maybe as a string): take the CSV's int
+            batch_data.append(_finalise_chat_data(coerced_data, first_row, DynamicModel, extracted_at))
+    return batch_data
+
+
+def _construct_trusted(DynamicModel: Type[BaseModel], data: Dict[str, Any]) -> BaseModel:
+    """Builds an instance without validation, recursing into nested models (TRUSTED_LLM_OUTPUT).
+
+    model_construct runs no validators, so the conversions they would do for the values
+    _coerce_llm_output hands over are done here: Likert ints → `Likert`, and the batch's
+    ISO `extracted_at` → datetime.
+    """
+    fields = DynamicModel.model_fields
+    likert_fields = _likert_fields(DynamicModel)
+    values: Dict[str, Any] = {}
+    for key, value in data.items():
+        if key not in fields:
+            continue
+        if key in likert_fields and isinstance(value, int):
+            try:
+                value = Likert(value)
+            except ValueError:
+                pass # Out of range: kept as-is, trusted mode writes what it got
+        elif key == "extracted_at" and isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        else:
+            nested = _nested_model(fields[key].annotation)
+            if nested is not None and isinstance(value, dict):
+                value = _construct_trusted(nested, value)
+        values[key] = value
+    return DynamicModel.model_construct(**values)
+
+
+def _to_json_bytes(data: Any) -> Optional[bytes]:
+    """orjson-encodes `data` for pydantic-core's JSON validator.
+
+    Validating JSON bytes stays in Rust end to end, which beats `validate_python` on
+    nested payloads. None when orjson is missing or a value isn't JSON-serialisable.
+    """
+    if orjson is None:
+        return None
+    try:
+        return orjson.dumps(data)
+    except TypeError:
+        return None
+
+
+def _validate_chat(
+    final_data_for_model: Dict[str, Any],
+    first_row: Dict[str, Any],
+    DynamicModel: Type[BaseModel],
+    extracted_at: str
+) -> BaseModel:
+    """Validates one chat's data, degrading to a fallback or minimal instance on failure."""
+    if TRUSTED_LLM_OUTPUT: # _coerce_llm_output already normalised it (Likert labels → ints)
+        return _construct_trusted(DynamicModel, final_data_for_model)
+    try:
+        payload = _to_json_bytes(final_data_for_model)
+        if payload is not None:
+            instance = DynamicModel.model_validate_json(payload)
+        else:
+            instance = DynamicModel.model_validate(final_data_for_model)
     except Exception as e: # Catch Pydantic validation errors or others
         # Log error, potentially save problematic response for debugging
-        print(f"Error validating LLM output for chat_id {prompt_format_args.get('chat_id')}: {e}")
-        print(f"Raw LLM response: {raw_response_json_str}")
-        print(f"Coerced data: {coerced_data}")
+        print(f"Error validating LLM output for chat_id {final_data_for_model.get('chat_id')}: {e}")
+        print(f"Coerced data: {final_data_for_model}")
         # Depending on desired behavior, either raise e, or return a partially filled/default model
         # For now, let's try to create a model with what we have, or an empty one if critical fields missing
+        valid_field_set = frozenset(DynamicModel.model_fields)
+        # Top-level fields pydantic rejected; re-validating them unchanged could only fail again
+        invalid_fields = (
+            {err["loc"][0] for err in e.errors() if err["loc"]} if isinstance(e, ValidationError) else set()
+        )
         try:
-            # Attempt to create a model with as much valid data as possible, ignoring extra fields
-            # This is a simplistic fallback.
-            valid_data_for_fallback = {k: v for k, v in final_data_for_model.items() if k in DynamicModel.model_fields}
+            # Attempt to create a model with as much valid data as possible, dropping extra and
+            # rejected fields, so a single re-validation salvages the rest of the chat.
+            valid_data_for_fallback = {
+                k: v for k, v in final_data_for_model.items()
+                if k in valid_field_set and k not in invalid_fields
+            }
             if "chat_id" not in valid_data_for_fallback:
-                 valid_data_for_fallback["chat_id"] = int(chat_df.iloc[0]["chat_id"])
+                 valid_data_for_fallback["chat_id"] = int(first_row["chat_id"])
             
             # Fallback for user_email in fallback model creation
             if "user_email" not in valid_data_for_fallback or valid_data_for_fallback.get("user_email") is None:
-                if "user_email" in chat_df.iloc[0].index and pd.notna(chat_df.iloc[0]["user_email"]):
-                    valid_data_for_fallback["user_email"] = chat_df.iloc[0]["user_email"]
+                if "user_email" in first_row and pd.notna(first_row["user_email"]):
+                    valid_data_for_fallback["user_email"] = first_row["user_email"]
                 else:
                     if "user_email" in DynamicModel.model_fields and not DynamicModel.model_fields["user_email"].is_required() is False:
                         if valid_data_for_fallback.get("user_email") is None:
                             valid_data_for_fallback["user_email"] = "unknown@example.com" # Placeholder
             
             # Ensure 'extracted_at' is also set in the fallback if the field exists.
-            if 'extracted_at' in DynamicModel.model_fields:
-                from datetime import datetime
-                valid_data_for_fallback['extracted_at'] = datetime.utcnow().isoformat()
+            if 'extracted_at' in valid_field_set:
+                valid_data_for_fallback['extracted_at'] = extracted_at
 
             instance = DynamicModel.model_validate(valid_data_for_fallback)
         except Exception as fallback_e:
-            print(f"Fallback model creation failed for chat_id {prompt_format_args.get('chat_id')}: {fallback_e}")
+            print(f"Fallback model creation failed for chat_id {final_data_for_model.get('chat_id')}: {fallback_e}")
             # Create a minimal instance if all else fails, to prevent crashing the whole batch
             # Requires chat_id and user_email to be in the DynamicModel schema for this to work.
             # This part needs to be robust: ensure critical identifying fields are present.
             minimal_data = {
-                "chat_id": int(chat_df.iloc[0]["chat_id"]),
-                "user_email": chat_df.iloc[0]["user_email"],
+                "chat_id": int(first_row["chat_id"]),
+                "user_email": first_row["user_email"] if pd.notna(first_row["user_email"]) else None,
             }
             # Fallback for user_email in minimal_data
             if minimal_data.get("user_email") is None:
@@ -270,18 +506,58 @@ async def analyse_chat_dynamically(
                      minimal_data["user_email"] = "unknown@example.com"
 
             # Ensure 'extracted_at' is also set in the minimal_data if the field exists.
-            if 'extracted_at' in DynamicModel.model_fields:
-                from datetime import datetime
-                minimal_data['extracted_at'] = datetime.utcnow().isoformat()
+            # (a real datetime: model_construct below does no string → datetime parsing)
+            if 'extracted_at' in valid_field_set:
+                minimal_data['extracted_at'] = datetime.fromisoformat(extracted_at)
             
-            # Add None for all other fields defined in the model to satisfy Pydantic
-            # for fields that are truly optional. 'extracted_at' is now handled.
-            for field_name in DynamicModel.model_fields:
+            # Add None for all other fields defined in the model.
+            for field_name in valid_field_set:
                 if field_name not in minimal_data: # if not chat_id, user_email, or extracted_at (if present)
-                    # This assumes other fields are Optional in their schema definition if they can be None.
-                    # If a field is required and not 'extracted_at', this minimal_data might still fail.
-                    # However, 'extracted_at' was the problematic one.
                     minimal_data[field_name] = None
-            instance = DynamicModel.model_validate(minimal_data)
+            # Identifiers + Nones only: construct without validation, which also cannot fail
+            # on a required field left empty, so one broken chat never crashes the batch.
+            instance = DynamicModel.model_construct(**minimal_data)
             
-    return instance 
\ No newline at end of file
+    return instance
+
+
+def validate_batch_dynamically(
+    batch_data: List[Dict[str, Any]],
+    first_rows: List[Dict[str, Any]],
+    DynamicModel: Type[BaseModel],
+    extracted_at: str
+) -> List[BaseModel]:
+    """Validates a whole batch in one pydantic-core call, falling back per chat on any error."""
+    if TRUSTED_LLM_OUTPUT:
+        return [_construct_trusted(DynamicModel, data) for data in batch_data]
+    adapter = TypeAdapter(List[DynamicModel])
+    payload = _to_json_bytes(batch_data)
+    try:
+        if payload is not None:
+            return adapter.validate_json(payload)
+        return adapter.validate_python(batch_data)
+    except ValidationError:
+        # At least one chat is broken: validate individually so only that chat degrades
+        return [
+            _validate_chat(data, first_row, DynamicModel, extracted_at)
+            for data, first_row in zip(batch_data, first_rows)
+        ]
+
+
+async def analyse_chat_dynamically(
+    chat_df: pd.DataFrame,
+    config: Dict[str, Any],
+    DynamicModel: Type[BaseModel],
+    extracted_at: Optional[str] = None
+) -> BaseModel:
+    """Processes a single chat DataFrame according to the provided dynamic model and config."""
+    if extracted_at is None:
+        extracted_at = datetime.now(timezone.utc).isoformat()
+    # Chat-level columns are constant within a chat: read the first row once as a plain dict
+    first_row = chat_df.iloc[0].to_dict()
+    # numpy boolean mask over the raw arrays, no intermediate Series/list
+    corpus = "\n".join(
+        chat_df["message"].values[chat_df["speaker"].values == "participant"]
+    )
+    final_data_for_model = await _raw_to_dict(first_row, corpus, config, DynamicModel, extracted_at)
+    return _validate_chat(final_data_for_model, first_row, DynamicModel, extracted_at)
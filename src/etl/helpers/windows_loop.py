@@ -1,4 +1,4 @@
-"""Allow asyncio on Windows when running as a module."""
+"""Allow asyncio on Windows when running as a module (and use uvloop elsewhere if present)."""
 import sys
 import asyncio
 
@@ -8,4 +8,15 @@ def patch_windows_event_loop():  # noqa: D401 – imperative
         try:
             asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())  # type: ignore[attr-defined]
         except AttributeError:
-            pass 
\ No newline at end of file
+            pass
+
+
+def install_uvloop():
+    """Use uvloop's faster event loop on POSIX when it is installed."""
+    if sys.platform.startswith("win"):
+        return
+    try:
+        import uvloop
+    except ImportError:
+        return
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
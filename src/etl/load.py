@@ -1,18 +1,19 @@
 """Upsert JSONB payloads → Postgres."""
 from __future__ import annotations
 
+import io
 import json
 import os
-from typing import Sequence
+from typing import Iterable, Iterator, Sequence
 
-import psycopg2
-from psycopg2.extras import Json, execute_values
-from dotenv import load_dotenv
+from psycopg2.pool import ThreadedConnectionPool
+try:
+    import orjson
+except ImportError:  # stdlib json fallback in _dump_payload
+    orjson = None
 
 from .models import StudentProfile
 
-load_dotenv()
-
 TABLE = "student_feedback"
 DDL = f"""
 CREATE TABLE IF NOT EXISTS {TABLE} (
@@ -21,6 +22,73 @@ CREATE TABLE IF NOT EXISTS {TABLE} (
     extracted_at TIMESTAMP WITH TIME ZONE NOT NULL
 );
 """
+STAGING = f"{TABLE}_staging"
+STAGING_DDL = f"""
+CREATE TEMP TABLE {STAGING} (LIKE {TABLE} INCLUDING DEFAULTS) ON COMMIT DROP;
+"""
+MERGE = f"""
+INSERT INTO {TABLE} (chat_id, payload, extracted_at)
+SELECT chat_id, payload, extracted_at FROM {STAGING}
+ON CONFLICT (chat_id) DO UPDATE
+SET payload = EXCLUDED.payload,
+    extracted_at = EXCLUDED.extracted_at;
+"""
+
+
+class _LineReader(io.TextIOBase):
+    """Read-only file over an iterator of text lines, for streaming into `copy_expert`."""
+
+    def __init__(self, lines: Iterable[str]):
+        self._lines: Iterator[str] = iter(lines)
+        self._buf = ""
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int | None = -1) -> str:
+        if size is None or size < 0:
+            out, self._buf = self._buf + "".join(self._lines), ""
+            return out
+        while len(self._buf) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._buf += line
+        out, self._buf = self._buf[:size], self._buf[size:]
+        return out
+
+    def readline(self, size: int | None = -1) -> str:
+        if self._buf:
+            out, self._buf = self._buf, ""
+            return out
+        return next(self._lines, "")
+
+
+def _dump_payload(p: StudentProfile) -> str:
+    """Serialise a profile to JSON, with orjson when installed (handles datetimes/enums natively)."""
+    if orjson is not None:
+        return orjson.dumps(p.model_dump(exclude_none=True), option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(p.model_dump(mode="json", exclude_none=True))
+
+
+def _copy_rows(batch: Sequence[StudentProfile]) -> Iterator[str]:
+    """Yield one COPY text-format line per profile: chat_id, JSON payload, extracted_at."""
+    for p in batch:
+        payload = _dump_payload(p)
+        # JSON encoders already escape tabs/newlines; only the COPY escape char needs doubling
+        payload = payload.replace("\\", "\\\\")
+        yield f"{p.chat_id}\t{payload}\t{p.extracted_at.isoformat()}\n"
+
+
+_POOL: ThreadedConnectionPool | None = None
+
+
+def _get_pool() -> ThreadedConnectionPool:
+    """Lazily open one process-wide pool, so repeated loads reuse their connections."""
+    global _POOL
+    if _POOL is None:
+        _POOL = ThreadedConnectionPool(1, 4, os.environ["DATABASE_URL"])
+    return _POOL
 
 
 def _ensure_table(cur):
@@ -28,26 +96,17 @@ def _ensure_table(cur):
 
 
 def load_batch(batch: Sequence[StudentProfile]):
-    DSN = os.environ["DATABASE_URL"]
-    records = [
-        (
-            p.chat_id,
-            Json(json.loads(p.model_dump_json(exclude_none=True))),
-            p.extracted_at,
-        )
-        for p in batch
-    ]
-
-    with psycopg2.connect(DSN) as conn, conn.cursor() as cur:
-        _ensure_table(cur)
-        execute_values(
-            cur,
-            f"""
-            INSERT INTO {TABLE} (chat_id, payload, extracted_at)
-            VALUES %s
-            ON CONFLICT (chat_id) DO UPDATE
-            SET payload = EXCLUDED.payload,
-                extracted_at = EXCLUDED.extracted_at;
-            """,
-            records,
-        ) 
\ No newline at end of file
+    pool = _get_pool()
+    conn = pool.getconn()
+    try:
+        with conn, conn.cursor() as cur:  # commits on success, rolls back on error
+            _ensure_table(cur)
+            # stream the batch into a temp table with COPY, then upsert in one statement
+            cur.execute(STAGING_DDL)
+            cur.copy_expert(
+                f"COPY {STAGING} (chat_id, payload, extracted_at) FROM STDIN WITH (FORMAT text)",
+                _LineReader(_copy_rows(batch)),
+            )
+            cur.execute(MERGE)
+    finally:
+        pool.putconn(conn) 
\ No newline at end of file
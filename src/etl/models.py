@@ -1,11 +1,30 @@
 """Pydantic schema – one row per conversation."""
 from __future__ import annotations
 
+import re
 from datetime import datetime
 from enum import Enum
 from typing import Optional, Any
 
-from pydantic import BaseModel, EmailStr, Field, validator
+from pydantic import AfterValidator, BaseModel, ConfigDict, Field, validator
+from typing_extensions import Annotated
+
+_EMAIL_RE = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+")  # fullmatch: unlike ^...$, rejects a trailing newline
+_NON_DIGIT = re.compile(r"\D+")
+
+
+def _check_email(v: str) -> str:
+    """Cheap syntactic check; unlike EmailStr, no email-validator normalisation per row."""
+    if not _EMAIL_RE.fullmatch(v):
+        raise ValueError(f"value is not a valid email address: {v!r}")
+    return v
+
+
+Email = Annotated[str, AfterValidator(_check_email)]
+
+# The pipeline validates against config-driven models (schema_factory); these static
+# models are only imported for typing, so their core schema is built on first use.
+_MODEL_CONFIG = ConfigDict(extra="ignore", defer_build=True)
 
 
 class Likert(int, Enum):
@@ -17,26 +36,32 @@ class Likert(int, Enum):
 
 
 class Education(BaseModel):
+    model_config = _MODEL_CONFIG
+
     institution: Optional[str] = None
     major: Optional[str] = None
     graduation_year: Optional[int] = None
 
 
 class ContactInfo(BaseModel):
+    model_config = _MODEL_CONFIG
+
     phone: Optional[str] = None
-    email: Optional[EmailStr] = None
+    email: Optional[Email] = None
 
     @validator("phone", pre=True, always=True)
     def _clean_phone(cls, v: str | None):  # noqa: N805 – pydantic rule
         if v:
-            digits = "".join(filter(str.isdigit, v))
+            digits = _NON_DIGIT.sub("", v)  # one C-level pass instead of a per-char filter
             return digits or None
         return None
 
 
 class StudentProfile(BaseModel):
+    model_config = _MODEL_CONFIG
+
     chat_id: int
-    user_email: EmailStr
+    user_email: Email
     consent: bool | None = None
 
     education: Education = Field(default_factory=Education)
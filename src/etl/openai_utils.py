@@ -1,41 +1,80 @@
 """Thin wrapper around OpenAI with JSON validation + retries."""
 from __future__ import annotations
 
-import json
+import asyncio
+import weakref
 from typing import Type, TypeVar
 
 import openai
 from pydantic import BaseModel, ValidationError
-from tenacity import retry, stop_after_attempt, wait_random_exponential
+from tenacity import retry, retry_if_not_exception_type, stop_after_attempt, wait_random_exponential
 
 from .constants import MAX_RETRIES, OPENAI_MODEL, TEMPERATURE
 
 T = TypeVar("T", bound=BaseModel)
 
+# One client per event loop: its keep-alive connections belong to the loop that opened them
+_CLIENTS: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, openai.AsyncOpenAI] = weakref.WeakKeyDictionary()
 
-@retry(stop=stop_after_attempt(MAX_RETRIES), wait=wait_random_exponential())
-def call_llm(prompt: str, schema: Type | str) -> T | str:
-    """Call LLM and coerce strict JSON into `schema`. Raises on failure. If schema is str, return raw JSON string."""
 
-    response = openai.chat.completions.create(
-        model=OPENAI_MODEL,
-        temperature=TEMPERATURE,
-        response_format={"type": "json_object"},
-        messages=[
-            {"role": "system", "content": "You are a strict JSON generator."},
-            {"role": "user", "content": prompt},
-        ],
-    )
+class LLMSchemaError(ValueError):
+    """The LLM answered, but not with a valid instance of the schema (not retried)."""
+
+
+def _get_client() -> openai.AsyncOpenAI:
+    """The running loop's async client, created lazily (after .env has been loaded)."""
+    loop = asyncio.get_running_loop()
+    client = _CLIENTS.get(loop)
+    if client is None:
+        client = _CLIENTS[loop] = openai.AsyncOpenAI()
+    return client
+
+
+async def close_client() -> None:
+    """Closes the running loop's client, if any, before that loop goes away."""
+    client = _CLIENTS.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
+
+
+@retry(  # tenacity awaits coroutines; a schema mismatch is deterministic, so it is not retried
+    stop=stop_after_attempt(MAX_RETRIES),
+    wait=wait_random_exponential(),
+    retry=retry_if_not_exception_type(LLMSchemaError),
+)
+async def call_llm(prompt: str, schema: Type | str) -> T | str:
+    """Call LLM and return an instance of `schema`. Raises on failure. If schema is str, return raw JSON string.
+
+    Async, so concurrent chats really overlap their HTTP round-trips on the event loop.
+    For a Pydantic `schema` the model itself is sent as a structured-outputs
+    response_format, so generation is constrained server-side and the SDK returns
+    the parsed instance; LLMSchemaError is raised when the answer still doesn't fit.
+    """
+    messages = [
+        {"role": "system", "content": "You are a strict JSON generator."},
+        {"role": "user", "content": prompt},
+    ]
 
-    content = response.choices[0].message.content  # pyright: ignore
     if schema is str:
-        return content
-    try:
-        payload = json.loads(content)
-    except json.JSONDecodeError as err:
-        raise ValueError(f"LLM returned invalid JSON: {content}") from err
+        response = await _get_client().chat.completions.create(
+            model=OPENAI_MODEL,
+            temperature=TEMPERATURE,
+            response_format={"type": "json_object"},
+            messages=messages,
+        )
+        return response.choices[0].message.content  # pyright: ignore
 
     try:
-        return schema.model_validate(payload)
-    except ValidationError as err:
-        raise ValueError(f"LLM JSON does not match schema: {err}") from err 
\ No newline at end of file
+        response = await _get_client().beta.chat.completions.parse(
+            model=OPENAI_MODEL,
+            temperature=TEMPERATURE,
+            response_format=schema,
+            messages=messages,
+        )
+    except (ValidationError, openai.LengthFinishReasonError, openai.ContentFilterFinishReasonError) as err:
+        raise LLMSchemaError(f"LLM JSON does not match schema: {err}") from err
+
+    message = response.choices[0].message
+    if message.parsed is None:  # refusal
+        raise LLMSchemaError(f"LLM returned no parsable output: {message.refusal or message.content}")
+    return message.parsed
@@ -1,23 +1,39 @@
 """Dynamically create Pydantic models from configuration."""
 from __future__ import annotations
 
+import functools
+import json
+import re
 from datetime import datetime
-from typing import Any, Dict, Optional, Type, Union, ForwardRef
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Type, Union, get_args, get_origin
 
 import yaml
-from pydantic import BaseModel, EmailStr, Field, create_model, BeforeValidator
+try:  # libyaml-backed loader is several times faster than the pure-Python one
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # pragma: no cover – PyYAML built without libyaml
+    from yaml import SafeLoader
+try:
+    import orjson
+except ImportError:  # stdlib json fallback in generate_schema_example
+    orjson = None
+from pydantic import BaseModel, Field, create_model, BeforeValidator
 from typing_extensions import Annotated # For Pydantic V2 Annotated types
 from pydantic.fields import FieldInfo
 
-from etl.models import Likert # Assuming Likert is still relevant
+from etl.models import Email, Likert
+
+_DIGIT_RE = re.compile(r"\d+")
+_EMAIL_CHECK = get_args(Email)[1] # Email's AfterValidator, to spot Email fields in the schema example
 
 def parse_arabic_likert_string(value: Any) -> Any:
+    if isinstance(value, int) and not isinstance(value, bool):
+        return max(1, min(5, value)) # Clamp to 1-5 range, like floats and strings
     if isinstance(value, float):
         num = round(value)
         return max(1, min(5, num)) # Clamp to 1-5 range
     if isinstance(value, str):
-        import re
-        match = re.search(r"\d+", value)
+        match = _DIGIT_RE.search(value)
         if match:
             try:
                 num = int(match.group(0))
@@ -29,82 +45,121 @@ def parse_arabic_likert_string(value: Any) -> Any:
 
 # Type mapping from YAML string to Python/Pydantic types
 # Needs to handle Optional via "type | None" string parsing
-# and nested models via recursion or ForwardRef
+# and nested models via recursion
 TYPE_MAP: Dict[str, Type[Any] | object] = {
     "int": int,
     "str": str,
     "bool": bool,
     "float": float,
     "datetime": datetime,
-    "EmailStr": EmailStr,
+    "EmailStr": Email, # regex-checked str, see etl.models.Email
     "Likert": Annotated[Likert, BeforeValidator(parse_arabic_likert_string)],
     # Add other custom types if needed
 }
 
-def _parse_type_string(type_str: str, model_name_prefix: str = "") -> Any:
-    """Parses a type string (e.g., "str | None", "List[int]") into a Python type or Pydantic FieldInfo."""
-    type_str = type_str.strip()
-    is_optional = "| None" in type_str
-    if is_optional:
-        type_str = type_str.replace("| None", "").strip()
-
-    if type_str in TYPE_MAP:
-        actual_type = TYPE_MAP[type_str]
-    else:
-        # Fallback for unrecognised simple types or potentially complex ones not yet handled
-        # This might need improvement for more complex scenarios like List[CustomType]
-        try:
-            actual_type = eval(type_str, {}, {**TYPE_MAP, **globals(), "Optional": Optional, "Union": Union})
-        except NameError:
-            # If a type is not found, it might be a forward reference to a nested model
-            # that will be created later. This is common in Pydantic for circular dependencies
-            # or when defining models out of order.
-            actual_type = ForwardRef(f"{model_name_prefix}{type_str}")
-        except Exception as e:
-            raise ValueError(f"Unsupported or malformed type string: {type_str}. Error: {e}")
-
-    if is_optional:
-        return Optional[actual_type]
-    return actual_type
-
-def create_dynamic_model(model_name: str, schema_config: Dict[str, Any]) -> Type[BaseModel]:
+# Tokens of the small type grammar the configs use: identifiers and | [ ] ?
+_TYPE_TOKEN_RE = re.compile(r"\s*(?:([A-Za-z_]\w*)|([|\[\]?]))")
+
+# Generic wrappers accepted around a single type argument
+_GENERICS = {"List": lambda t: list[t], "list": lambda t: list[t], "Optional": lambda t: Optional[t]}
+
+def _tokenize_type(type_str: str) -> list[str]:
+    tokens, pos = [], 0
+    while pos < len(type_str):
+        match = _TYPE_TOKEN_RE.match(type_str, pos)
+        if not match:
+            if type_str[pos:].isspace():
+                break
+            raise ValueError(f"Unsupported or malformed type string: {type_str}")
+        tokens.append(match.group(1) or match.group(2))
+        pos = match.end()
+    return tokens
+
+def _parse_type_string(type_str: str) -> Any:
+    """Parses a type string (e.g., "str | None", "List[int]") into a Python type.
+
+    Supported grammar: `T`, `T | None`, `T?`, `List[T]` and `Optional[T]`, where `T` is a
+    TYPE_MAP name or another such expression. Unknown names raise ValueError.
+    """
+    # Tiny recursive-descent parser instead of eval(): no compile per field, no code execution
+    tokens = _tokenize_type(type_str)
+    pos = 0
+
+    def _expr() -> Any:
+        # union of atoms; only `X | None` (either order) is meaningful here
+        nonlocal pos
+        members = [_atom()]
+        while pos < len(tokens) and tokens[pos] == "|":
+            pos += 1
+            members.append(_atom())
+        is_optional = type(None) in members
+        members = [m for m in members if m is not type(None)]
+        if len(members) != 1:
+            raise ValueError(f"Unsupported or malformed type string: {type_str}")
+        result = members[0]
+        if pos < len(tokens) and tokens[pos] == "?":
+            pos += 1
+            is_optional = True
+        return Optional[result] if is_optional else result
+
+    def _atom() -> Any:
+        nonlocal pos
+        if pos >= len(tokens) or tokens[pos] in ("|", "[", "]", "?"):
+            raise ValueError(f"Unsupported or malformed type string: {type_str}")
+        name = tokens[pos]
+        pos += 1
+        if name == "None":
+            return type(None)
+        if name in _GENERICS:
+            if pos >= len(tokens) or tokens[pos] != "[":
+                raise ValueError(f"Unsupported or malformed type string: {type_str}")
+            pos += 1
+            inner = _expr()
+            if pos >= len(tokens) or tokens[pos] != "]":
+                raise ValueError(f"Unsupported or malformed type string: {type_str}")
+            pos += 1
+            return _GENERICS[name](inner)
+        if name not in TYPE_MAP:
+            raise ValueError(f"Unknown type '{name}' in type string: {type_str}")
+        return TYPE_MAP[name]
+
+    result = _expr()
+    if pos != len(tokens):
+        raise ValueError(f"Unsupported or malformed type string: {type_str}")
+    return result
+
+def create_dynamic_model(
+    model_name: str, schema_config: Dict[str, Any], *, _is_root: bool = True
+) -> Type[BaseModel]:
     """Creates a Pydantic model dynamically from a schema configuration.
 
     Args:
         model_name: The name for the new Pydantic model.
         schema_config: A dictionary where keys are field names and values are either
                        type strings (e.g., "str | None") or nested schema dicts.
+        _is_root: False for the recursive calls building nested models; only the
+                  outermost model is rebuilt.
 
     Returns:
         A dynamically created Pydantic BaseModel class.
     """
     fields: Dict[str, Any] = {}
-    nested_models: Dict[str, Type[BaseModel]] = {}
-
-    # First pass: create ForwardRefs for all potential nested models
-    for field_name, type_info in schema_config.items():
-        if isinstance(type_info, dict):
-            # It's a nested model. We'll define it later, but declare a ForwardRef for now.
-            # The actual nested model name will be prefixed to avoid naming collisions.
-            nested_model_name = f"{model_name}_{field_name.capitalize()}"
-            # The type in the parent model will be this ForwardRef.
-            # fields[field_name] = (ForwardRef(f"'{nested_model_name}'"), FieldInfo(default=None) if "None" in str(type_info) else ...)
-            # This part is tricky with dynamic optionality for nested models.
-            # For simplicity, let's assume nested models can be optional if any of their fields can be.
-            # A more robust way would be to have an explicit "optional: true" in the YAML for nested structures.
 
-    # Second pass: define fields and create actual nested models
+    # Define fields, creating nested models recursively (nested names are prefixed to avoid collisions)
     for field_name, type_info in schema_config.items():
         if isinstance(type_info, dict):
             # It's a nested model
             nested_model_name = f"{model_name}_{field_name.capitalize()}"
-            nested_model_class = create_dynamic_model(nested_model_name, type_info)
-            nested_models[nested_model_name] = nested_model_class
+            nested_model_class = create_dynamic_model(nested_model_name, type_info, _is_root=False)
             # Determine if the nested model itself should be optional.
             # Heuristic: if all fields in the nested model are optional, or if it's an empty dict,
             # consider making the field for the nested model optional in the parent.
             # This logic can be refined based on how optionality of nested structures is defined in YAML.
-            is_nested_optional = all("| None" in str(v) for v in type_info.values()) if type_info else True
+            # Same optionality test as leaf fields below ("T | None", "T?", "Optional[T]", ...);
+            # a nested sub-dict never counts as optional.
+            is_nested_optional = True if not type_info else all(
+                isinstance(v, str) and type(None) in get_args(_parse_type_string(v)) for v in type_info.values()
+            )
             if is_nested_optional:
                  fields[field_name] = (Optional[nested_model_class], Field(default_factory=lambda: None))
             else:
@@ -112,11 +167,8 @@ def create_dynamic_model(model_name: str, schema_config: Dict[str, Any]) -> Type
 
         elif isinstance(type_info, str):
             # It's a simple type string
-            parsed_type = _parse_type_string(type_info, model_name_prefix=f"{model_name}_")
-            if isinstance(parsed_type, ForwardRef) or (hasattr(parsed_type, "__origin__") and parsed_type.__origin__ is Union and any(isinstance(arg, ForwardRef) for arg in parsed_type.__args__)):
-                # Handle Optional[ForwardRef(...)] or simple ForwardRef(...)
-                default_value = Field(default=None)
-            elif "| None" in type_info or type_info.endswith("?") : # Check for optional flag
+            parsed_type = _parse_type_string(type_info)
+            if type(None) in get_args(parsed_type): # "T | None", "T?" or "Optional[T]"
                 default_value = Field(default=None)
             else:
                 default_value = Field(...)
@@ -127,40 +179,121 @@ def create_dynamic_model(model_name: str, schema_config: Dict[str, Any]) -> Type
     # Create the main model
     DynamicModel = create_model(model_name, **fields) # type: ignore
 
-    # Update forward refs for any nested models within this scope
-    # Pydantic V2 typically handles ForwardRef resolution more automatically.
-    # The nested_models created should be resolvable if they are in scope.
-    DynamicModel.model_rebuild(force=True)
-
-    # For nested models, ensure their ForwardRefs are also resolved.
-    # They are already created and should be part of the module's globals directly or indirectly.
-    for _nested_name, nested_model_cls in nested_models.items():
-        nested_model_cls.model_rebuild(force=True)
+    # Update forward refs once, from the outermost model: that single rebuild covers the
+    # nested models too; rebuilding each level as well would regenerate their core
+    # schemas once per ancestor.
+    if _is_root:
+        DynamicModel.model_rebuild(force=True)
 
     return DynamicModel
 
-def load_config_and_create_model(config_path: str) -> Type[BaseModel]:
-    """Loads YAML config and creates a dynamic Pydantic model."""
-    with open(config_path, 'r') as f:
-        config = yaml.safe_load(f)
+def _is_likert_annotation(annotation: Any) -> bool:
+    """True for `Likert` and `Optional[Likert]` annotations, also wrapped in `Annotated[...]`."""
+    if get_origin(annotation) is Annotated: # TYPE_MAP's Likert carries a BeforeValidator
+        annotation = get_args(annotation)[0]
+    if annotation is Likert:
+        return True
+    if get_origin(annotation) is Union: # Handles Optional[Likert]
+        type_args = get_args(annotation)
+        return type(None) in type_args and any(
+            _is_likert_annotation(arg) for arg in type_args if arg is not type(None)
+        )
+    return False
+
+def classify_fields(model: Type[BaseModel]) -> Dict[str, str]:
+    """Maps each field of `model` to the coercion kind used on LLM output.
 
+    Kinds are "likert", "edu" (the `education` block), "contact" (the `contact_info`
+    block) or "plain". Computed once per model rather than once per field per chat.
+    """
+    field_kind: Dict[str, str] = {}
+    for field_name, field_info in model.model_fields.items():
+        if _is_likert_annotation(field_info.annotation):
+            field_kind[field_name] = "likert"
+        elif field_name == "education":
+            field_kind[field_name] = "edu"
+        elif field_name == "contact_info":
+            field_kind[field_name] = "contact"
+        else:
+            field_kind[field_name] = "plain"
+    return field_kind
+
+def load_config(config_path: str | Path) -> Dict[str, Any]:
+    """Loads a YAML config, reusing a pre-parsed JSON sidecar when it is up to date.
+
+    The sidecar (`<config>.yml.jsoncache`) is keyed on mtime: it is only trusted when it
+    is at least as new as the YAML file, otherwise the YAML is parsed and the cache rewritten.
+    """
+    path = Path(config_path)
+    cache = path.with_suffix(path.suffix + ".jsoncache")
+    try:
+        if cache.stat().st_mtime >= path.stat().st_mtime:
+            with cache.open("rb") as f:
+                return json.load(f)
+    except (OSError, ValueError):
+        pass # No cache yet, or it is unreadable/corrupt: fall back to parsing the YAML
+
+    with path.open("r", encoding="utf-8") as f:
+        config = yaml.load(f, Loader=SafeLoader)
+
+    try:
+        with cache.open("w", encoding="utf-8") as f:
+            json.dump(config, f, ensure_ascii=False)
+    except (OSError, TypeError, ValueError):
+        # Read-only checkout or a value JSON cannot represent: just skip caching.
+        cache.unlink(missing_ok=True)
+    return config
+
+def create_model_from_config(config: Dict[str, Any]) -> Type[BaseModel]:
+    """Creates a dynamic Pydantic model from an already parsed config dict."""
     model_name = config.get("model_name", "DynamicSurveyModel")
     schema_config = config.get("schema", {})
     if not schema_config:
         raise ValueError("Schema configuration is missing or empty in the YAML file.")
 
-    return create_dynamic_model(model_name, schema_config)
+    # Keyed on the schema content, so re-loading the same (or an unchanged) config is free.
+    # The key is order-sensitive on purpose: YAML order is the model's field order, which
+    # reaches the prompt's schema example and model_dump.
+    cache_key = (model_name, json.dumps(schema_config))
+    DynamicModel = _MODEL_CACHE.get(cache_key)
+    if DynamicModel is None:
+        DynamicModel = _MODEL_CACHE[cache_key] = _build_model(model_name, schema_config)
+    return DynamicModel
+
+# Dynamic models built so far, keyed by (model_name, schema JSON)
+_MODEL_CACHE: Dict[Tuple[str, str], Type[BaseModel]] = {}
+
+def _build_model(model_name: str, schema_config: Dict[str, Any]) -> Type[BaseModel]:
+    """Builds the dynamic model plus its coercion metadata."""
+    DynamicModel = create_dynamic_model(model_name, schema_config)
+    # Precompute per-field coercion metadata once for the whole run
+    DynamicModel.__field_kind__ = classify_fields(DynamicModel)
+    DynamicModel.__likert_fields__ = frozenset(
+        name for name, kind in DynamicModel.__field_kind__.items() if kind == "likert"
+    )
+    return DynamicModel
 
+def load_config_and_create_model(config_path: str | Path) -> Type[BaseModel]:
+    """Loads YAML config and creates a dynamic Pydantic model."""
+    return create_model_from_config(load_config(config_path))
+
+@functools.lru_cache(maxsize=8)
 def generate_schema_example(model: Type[BaseModel]) -> str:
-    """Generates a JSON string representation of the model schema for use in prompts."""
-    import json
+    """Generates a JSON string representation of the model schema for use in prompts.
+
+    The model is fixed for a run, so the result is memoised per model class.
+    """
     # Simplified schema for prompt, focusing on field names and types
     # Pydantic's model_json_schema() is comprehensive but can be verbose for a prompt.
     # This creates a simpler { "field": "type" } representation.
     
     schema_dict = {}
     for field_name, field_info in model.model_fields.items():
-        type_repr = str(field_info.annotation)
+        if _EMAIL_CHECK in field_info.metadata:
+            # Email is a plain str once pydantic strips its validator; keep the config's hint
+            schema_dict[field_name] = "EmailStr"
+            continue
+        type_repr = str(field_info.annotation).replace(str(Email), "EmailStr") # Optional[Email]
         # Clean up type representation for readability in prompt
         type_repr = type_repr.replace('typing.Optional[', 'Optional[')
         type_repr = type_repr.replace('pydantic.types.', '') # Clean up pydantic type paths
@@ -170,4 +303,6 @@ def generate_schema_example(model: Type[BaseModel]) -> str:
 
         schema_dict[field_name] = type_repr
         
+    if orjson is not None:
+        return orjson.dumps(schema_dict, option=orjson.OPT_INDENT_2).decode()
     return json.dumps(schema_dict, indent=2) 
\ No newline at end of file
@@ -2,16 +2,29 @@
 from __future__ import annotations
 
 import asyncio
-from typing import List, Dict, Any, Type
+import weakref
+from itertools import islice
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Tuple, Type
 
 import pandas as pd
 from pydantic import BaseModel
 
-from .generic_analysis import analyse_chat_dynamically # Changed import
+from .generic_analysis import _raw_to_dicts_batched, validate_batch_dynamically
 # StudentProfile is no longer directly used here, replaced by DynamicModel
-from .constants import MAX_CONCURRENT_REQUESTS
+from .constants import LLM_BATCH_SIZE, MAX_CONCURRENT_REQUESTS
 
-_SEM = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+# One semaphore per event loop, created lazily inside it (never bound to an import-time loop)
+_SEMS: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore] = weakref.WeakKeyDictionary()
+
+
+def _sem() -> asyncio.Semaphore:
+    """The MAX_CONCURRENT_REQUESTS semaphore of the running event loop."""
+    loop = asyncio.get_running_loop()
+    sem = _SEMS.get(loop)
+    if sem is None:
+        sem = _SEMS[loop] = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    return sem
 
 
 async def transform_batch_dynamically(
@@ -20,12 +33,38 @@ async def transform_batch_dynamically(
     DynamicModel: Type[BaseModel]
 ) -> List[BaseModel]: # Return type is now List[BaseModel]
     """Fan-out concurrent LLM calls for the whole batch, limited by a semaphore.
-    Uses dynamic configuration and model for analysis.
+    Uses dynamic configuration and model for analysis; the gathered results are
+    validated against DynamicModel in a single batch call.
     """
-    async def _run(group: pd.DataFrame) -> BaseModel: # Return type is BaseModel
-        async with _SEM:
-            # Call the new dynamic analysis function
-            return await analyse_chat_dynamically(group, config, DynamicModel)
+    # One timestamp for the whole batch, shared by every record
+    extracted_at = datetime.now(timezone.utc).isoformat()
+
+    # One columnar pass for the whole batch instead of a boolean mask per chat:
+    # participant corpora per chat, and each chat's first row (df is sorted by chat_id).
+    # Categorical comparison works on the codes, without materialising an object array
+    is_participant = df["speaker"].values == "participant"
+    corpora = (
+        df.loc[is_participant]
+        .groupby("chat_id", sort=False, observed=True)["message"]
+        .agg("\n".join)
+        .to_dict()
+    )
+    first_rows = df.drop_duplicates("chat_id").to_dict("records")
+
+    # LLM_BATCH_SIZE chats per request (1 = one request per chat)
+    chats = iter([(first_row, corpora.get(first_row["chat_id"], "")) for first_row in first_rows])
+    windows = list(iter(lambda: list(islice(chats, LLM_BATCH_SIZE)), []))
+
+    sem = _sem()
+    # Pre-sized and filled by index as windows finish, so the output keeps first_rows' order
+    window_data: List[Optional[List[Dict[str, Any]]]] = [None] * len(windows)
+
+    async def _run(idx: int, window: List[Tuple[Dict[str, Any], str]]) -> None:
+        async with sem:
+            # LLM call + coercion only; validation is deferred to the batch
+            window_data[idx] = await _raw_to_dicts_batched(window, config, DynamicModel, extracted_at)
 
-    tasks = [_run(group) for _, group in df.groupby("chat_id")]
-    return await asyncio.gather(*tasks) 
\ No newline at end of file
+    for finished in asyncio.as_completed([_run(idx, window) for idx, window in enumerate(windows)]):
+        await finished # Surfaces the first failure as soon as it happens
+    batch_data = [data for window in window_data for data in window]
+    return validate_batch_dynamically(batch_data, first_rows, DynamicModel, extracted_at) 
\ No newline at end of file
@@ -0,0 +1,13 @@
+"""Shared fixtures."""
+from pathlib import Path
+
+import pytest
+import yaml
+
+STUDENT_CONFIG_PATH = Path(__file__).resolve().parents[1] / "src" / "etl" / "configs" / "student.yml"
+
+
+@pytest.fixture
+def student_config():
+    """A freshly parsed `student.yml`, safe to mutate."""
+    return yaml.safe_load(STUDENT_CONFIG_PATH.read_text(encoding="utf-8"))
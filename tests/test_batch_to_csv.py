@@ -0,0 +1,24 @@
+"""CSV export of validated dynamic models."""
+from etl import _batch_to_csv_dynamically
+from etl.schema_factory import create_model_from_config
+
+
+def test_likert_columns_are_written_as_integers(student_config, tmp_path):
+    StudentProfile = create_model_from_config(student_config)
+    instance = StudentProfile.model_validate({
+        "chat_id": 7,
+        "user_email": "a@b.com",
+        "satisfaction_rating": "4",
+        "industry_alignment_rating": 2,
+        "education": {"institution": "UoB", "graduation_year": 2023},
+        "contact_info": {"phone": "0501234567"},
+        "extracted_at": "2024-01-01T00:00:00+00:00",
+    })
+    out = tmp_path / "out.csv"
+
+    _batch_to_csv_dynamically([instance], student_config["csv_mapping"], out)
+
+    assert out.read_text(encoding="utf-8").splitlines() == [
+        ",".join(student_config["csv_mapping"]),
+        "7,a@b.com,,,,,4,,,2,,,UoB,,2023,0501234567,",
+    ]
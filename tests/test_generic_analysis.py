@@ -0,0 +1,113 @@
+"""LLM output handling for one chat."""
+import asyncio
+import warnings
+from types import SimpleNamespace
+
+import pytest
+
+from etl import generic_analysis, openai_utils
+from etl.models import Likert
+from etl.schema_factory import create_model_from_config
+
+EXTRACTED_AT = "2024-01-01T00:00:00+00:00"
+
+
+class _FakeCompletions:
+    """Structured parse always fails validation; JSON mode returns `content`."""
+
+    def __init__(self, StudentProfile, content):
+        self.StudentProfile = StudentProfile
+        self.content = content
+        self.parse_calls = 0
+
+    async def parse(self, **kwargs):
+        self.parse_calls += 1
+        # Raises ValidationError, as the SDK does when the answer doesn't fit the model
+        self.StudentProfile.model_validate({"chat_id": 1, "user_email": "unknown", "extracted_at": EXTRACTED_AT})
+
+    async def create(self, **kwargs):
+        message = SimpleNamespace(content=self.content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def test_structured_output_mismatch_falls_back_to_json_mode(student_config, monkeypatch):
+    StudentProfile = create_model_from_config(student_config)
+    completions = _FakeCompletions(StudentProfile, '{"user_email": "unknown", "satisfaction_rating": "4"}')
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions), beta=SimpleNamespace(
+        chat=SimpleNamespace(completions=completions)
+    ))
+    monkeypatch.setattr(openai_utils, "_get_client", lambda: client)
+    monkeypatch.setattr(generic_analysis, "STRUCTURED_LLM_OUTPUT", True)
+    first_row = {"chat_id": 1, "user_email": "a@b.com"}
+
+    data = asyncio.run(generic_analysis._raw_to_dict(first_row, "hi", student_config, StudentProfile, EXTRACTED_AT))
+    [instance] = generic_analysis.validate_batch_dynamically([data], [first_row], StudentProfile, EXTRACTED_AT)
+
+    assert completions.parse_calls == 1 # schema mismatches are not retried
+    assert instance.chat_id == 1
+    assert instance.satisfaction_rating == 4
+
+
+@pytest.mark.parametrize("trusted", [True, False])
+def test_trusted_construct_matches_validated_types(student_config, monkeypatch, trusted):
+    student_config["schema"]["education"]["rating"] = "Likert | None" # nested Likert field
+    StudentProfile = create_model_from_config(student_config)
+    monkeypatch.setattr(generic_analysis, "TRUSTED_LLM_OUTPUT", trusted)
+    first_row = {"chat_id": 1, "user_email": "a@b.com"}
+    coerced = generic_analysis._coerce_llm_output(
+        '{"satisfaction_rating": "very satisfied", "education": {"institution": "UoB", "rating": "neutral"}}',
+        StudentProfile,
+    )
+    data = generic_analysis._finalise_chat_data(coerced, first_row, StudentProfile, EXTRACTED_AT)
+
+    [instance] = generic_analysis.validate_batch_dynamically([data], [first_row], StudentProfile, EXTRACTED_AT)
+
+    assert instance.satisfaction_rating is Likert.five
+    assert instance.education.institution == "UoB"
+    assert instance.education.rating is Likert.three
+    assert instance.extracted_at.isoformat() == EXTRACTED_AT
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        instance.model_dump(mode="json")
+
+
+def test_client_is_per_event_loop(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+
+    async def _client_of_this_loop():
+        client = openai_utils._get_client()
+        assert openai_utils._get_client() is client
+        await openai_utils.close_client()
+        return client
+
+    assert asyncio.run(_client_of_this_loop()) is not asyncio.run(_client_of_this_loop())
+    assert not openai_utils._CLIENTS
+
+
+@pytest.mark.parametrize("batch_response, retried", [
+    # chat 1 by string id, chat 2 garbled (no chat_id), chat 3 missing
+    ('{"results": [{"chat_id": "1", "motivation": "batched 1"}, {"motivation": "?"}]}', [2, 3]),
+    ("not json at all", [1, 2, 3]),
+])
+def test_batched_results_are_matched_by_chat_id_and_gaps_retried(student_config, monkeypatch, batch_response, retried):
+    StudentProfile = create_model_from_config(student_config)
+    singles = []
+
+    async def fake_call_llm(prompt, schema):
+        if "This request covers 3 separate chats" in prompt:
+            return batch_response
+        chat_id = int(prompt.split("Chat id: ", 1)[1].split("\n", 1)[0])
+        singles.append(chat_id)
+        return f'{{"motivation": "single {chat_id}"}}'
+
+    monkeypatch.setattr(generic_analysis, "call_llm", fake_call_llm)
+    chats = [({"chat_id": i, "user_email": f"u{i}@b.com"}, f"corpus {i}") for i in (1, 2, 3)]
+
+    data = asyncio.run(generic_analysis._raw_to_dicts_batched(chats, student_config, StudentProfile, EXTRACTED_AT))
+
+    assert singles == retried
+    assert [d["chat_id"] for d in data] == [1, 2, 3]
+    assert [d["user_email"] for d in data] == ["u1@b.com", "u2@b.com", "u3@b.com"]
+    assert [d["motivation"] for d in data] == [
+        f"single {i}" if i in retried else f"batched {i}" for i in (1, 2, 3)
+    ]
@@ -0,0 +1,44 @@
+"""COPY streaming helpers (no database needed)."""
+from datetime import datetime, timezone
+
+import pytest
+from pydantic import BaseModel
+
+from etl import load
+
+
+class _Row(BaseModel):
+    chat_id: int
+    text: str
+    extracted_at: datetime
+
+
+def test_line_reader_read_chunks_span_line_boundaries():
+    reader = load._LineReader(["ab\n", "cde\n", "", "f\n"])
+
+    assert reader.read(2) == "ab"
+    assert reader.read(3) == "\ncd"
+    assert reader.read(100) == "e\nf\n"
+    assert reader.read(1) == ""
+    assert load._LineReader(["ab\n", "c\n"]).read() == "ab\nc\n"
+
+
+# Expected payloads as COPY text format sees them: every JSON backslash escape is doubled
+_ORJSON_PAYLOAD = r'{"chat_id":7,"text":"tab\\there\\nnew\\\\line مرحبا","extracted_at":"2024-01-01T00:00:00+00:00"}'
+_JSON_PAYLOAD = (
+    r'{"chat_id": 7, "text": "tab\\there\\nnew\\\\line \\u0645\\u0631\\u062d\\u0628\\u0627", '
+    r'"extracted_at": "2024-01-01T00:00:00Z"}'
+)
+
+
+@pytest.mark.parametrize("use_orjson, payload", [(True, _ORJSON_PAYLOAD), (False, _JSON_PAYLOAD)])
+def test_copy_rows_escapes_payload_for_text_format(monkeypatch, use_orjson, payload):
+    if not use_orjson:
+        monkeypatch.setattr(load, "orjson", None)
+    elif load.orjson is None:
+        pytest.skip("orjson not installed")
+    row = _Row(chat_id=7, text="tab\there\nnew\\line مرحبا", extracted_at=datetime(2024, 1, 1, tzinfo=timezone.utc))
+
+    [line] = load._copy_rows([row])
+
+    assert line == f"7\t{payload}\t2024-01-01T00:00:00+00:00\n"
@@ -0,0 +1,47 @@
+"""Dynamic model creation from the shipped configs."""
+import copy
+import json
+from typing import Optional
+
+import pytest
+from pydantic import ValidationError
+
+from etl.schema_factory import create_dynamic_model, create_model_from_config, generate_schema_example
+
+
+def test_model_keeps_yaml_field_order_and_is_cached(student_config):
+    StudentProfile = create_model_from_config(student_config)
+
+    assert list(StudentProfile.model_fields) == list(student_config["schema"])
+    assert create_model_from_config(copy.deepcopy(student_config)) is StudentProfile
+
+
+def test_likert_fields_are_classified_through_annotated(student_config):
+    StudentProfile = create_model_from_config(student_config)
+
+    assert StudentProfile.__likert_fields__ == {"satisfaction_rating", "industry_alignment_rating"}
+
+
+def test_type_strings_are_parsed_without_eval():
+    Model = create_dynamic_model("Parsed", {"a": "int", "b": "Optional[int]", "c": "List[str] | None"})
+
+    assert Model.model_fields["a"].is_required()
+    assert not Model.model_fields["b"].is_required()
+    assert Model.model_fields["c"].annotation == Optional[list[str]]
+    with pytest.raises(ValueError, match="Unknown type 'Foo'"):
+        create_dynamic_model("Broken", {"a": "Foo | None"})
+
+
+def test_email_fields_keep_their_hint_and_reject_trailing_newline():
+    Model = create_dynamic_model("Emails", {"user_email": "EmailStr", "email": "EmailStr | None"})
+
+    assert json.loads(generate_schema_example(Model)) == {"user_email": "EmailStr", "email": "Optional[EmailStr]"}
+    with pytest.raises(ValidationError):
+        Model.model_validate({"user_email": "a@b.com\n"})
+
+
+def test_nested_block_of_optional_fields_is_optional():
+    Model = create_dynamic_model("Nested", {"block": {"a": "Optional[str]", "b": "None | int", "c": "bool?"}})
+
+    assert Model.model_validate({"block": None}).block is None
+    assert Model.model_validate({}).block is None